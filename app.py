@@ -1,5 +1,5 @@
 mport os, json, sqlite3, time, unicodedata, re
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 from fastapi import FastAPI, Header, HTTPException, Body, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
@@ -47,8 +47,14 @@ async def options_catch_all(full_path: str) -> Response:
 AUTH_TOKEN     = (os.getenv("X_AUTH_TOKEN") or os.getenv("AUTH_TOKEN") or "abc123").strip()
 DB_PATH        = os.getenv("DB_PATH", "data/oathlink.db")
 SEARCH_MODE    = (os.getenv("SEARCH_MODE") or "like").lower()  # like | fts（本版預設 like）
+STORAGE_ENGINE = (os.getenv("STORAGE_ENGINE") or "sqlite").lower()  # sqlite | memory（讀多寫少時用 memory）
+MEM_PATH       = os.getenv("MEM_PATH") or (os.path.splitext(DB_PATH)[0] + ".mem")  # memory 引擎的 .snap / .log 路徑前綴
+MEM_SNAPSHOT_EVERY = int(os.getenv("MEM_SNAPSHOT_EVERY") or "1000")  # 每累積 N 筆日誌寫一次快照
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
+if STORAGE_ENGINE not in ("sqlite", "memory"):
+    raise RuntimeError(f"Unknown STORAGE_ENGINE={STORAGE_ENGINE!r}; expected 'sqlite' or 'memory'")
+
 # =========================
 # JSON 回傳：強制 UTF-8 / 非 ASCII 不轉義
 # =========================
@@ -99,6 +105,9 @@ def _norm(s: str) -> str:
 
 def _write_memory(content: str, tags: List[str], ts: Optional[float] = None) -> str:
     mid = _mk_id()
+    if mem is not None:
+        mem.put(mid, _norm(content), tags or [], ts or _now())
+        return mid
     cur.execute(
         "INSERT INTO memory (id, content, tags, ts) VALUES (?,?,?,?)",
         (mid, _norm(content), json.dumps(tags or [], ensure_ascii=False), ts or _now())
@@ -123,9 +132,62 @@ def _search_like(q: str, top_k: int) -> List[Dict[str, Any]]:
     return [_row_to_mem(r) for r in rows]
 
 def _search_memory(q: str, top_k: int) -> List[Dict[str, Any]]:
-    # 本版預設以 LIKE 搜，FTS 有需要再擴充
+    # 本版預設以 LIKE 搜，FTS 有需要再擴充；memory 引擎以相同 LIKE 語意比對
+    if mem is not None:
+        return mem.search(_norm(q), top_k)
     return _search_like(q, top_k)
 
+def _recent_memory(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    if mem is not None:
+        return mem.recent(limit)
+    if limit is None:
+        rows = cur.execute("SELECT id, content, tags, ts FROM memory ORDER BY ts DESC").fetchall()
+    else:
+        rows = cur.execute("SELECT id, content, tags, ts FROM memory ORDER BY ts DESC LIMIT ?", (limit,)).fetchall()
+    return [_row_to_mem(r) for r in rows]
+
+def _memory_stats() -> Tuple[int, Optional[float]]:
+    if mem is not None:
+        return mem.stats()
+    row = cur.execute("SELECT COUNT(*) AS c, MAX(ts) AS t FROM memory").fetchone()
+    return row["c"] or 0, row["t"]
+
+def _memory_items() -> List[Tuple[str, str]]:
+    if mem is not None:
+        return list(mem.items())
+    return [(r["id"], r["content"]) for r in cur.execute("SELECT id, content FROM memory").fetchall()]
+
+def _set_memory_content(mid: str, content: str):
+    if mem is not None:
+        mem.set_content(mid, content)
+    else:
+        cur.execute("UPDATE memory SET content=? WHERE id=?", (content, mid))
+
+def _reset_memory():
+    # memory 模式只清記憶體庫；SQLite 保持原樣（seeded 標記保留，重啟不會再匯入）
+    if mem is not None:
+        mem.reset()
+        return
+    cur.execute("DELETE FROM memory;")
+    con.commit()
+
+# =========================
+# 儲存引擎：sqlite（預設）| memory（純記憶體 + 日誌/快照）
+# =========================
+mem = None
+if STORAGE_ENGINE == "memory":
+    from memstore import MemStore
+    mem = MemStore(MEM_PATH, snapshot_every=MEM_SNAPSHOT_EVERY)
+    # 首次切換：由 SQLite 既有資料匯入一次（快照記錄 seeded，之後不再匯入）
+    if not mem.seeded:
+        rows = cur.execute("SELECT id, content, tags, ts FROM memory").fetchall()
+        mem.bulk_put([_row_to_mem(r) for r in rows])
+
+@app.on_event("shutdown")
+def _close_storage():
+    if mem is not None:
+        mem.close()
+
 # =========================
 # 權限
 # =========================
@@ -144,6 +206,7 @@ def root():
         "service": APP_TITLE,
         "version": APP_VERSION,
         "search_mode": SEARCH_MODE,
+        "storage_engine": STORAGE_ENGINE,
         "paths": [r.path for r in app.router.routes],
         "ts": _now(),
     })
@@ -182,15 +245,13 @@ async def debug_echo(request: Request, x_auth_token: Optional[str] = Header(defa
 @app.post("/debug/reset", summary="Danger: clear all memory")
 def debug_reset(x_auth_token: Optional[str] = Header(default=None, alias="X-Auth-Token")):
     _guard(x_auth_token)
-    cur.execute("DELETE FROM memory;")
-    con.commit()
+    _reset_memory()
     return json_utf8({"ok": True, "reset": True, "ts": _now()})
 
 @app.get("/debug/peek", summary="Peek last 50 memory rows")
 def debug_peek(x_auth_token: Optional[str] = Header(default=None, alias="X-Auth-Token")):
     _guard(x_auth_token)
-    rows = cur.execute("SELECT * FROM memory ORDER BY ts DESC LIMIT 50").fetchall()
-    items = [_row_to_mem(r) for r in rows]
+    items = _recent_memory(50)
     return json_utf8({"ok": True, "rows": items, "ts": _now()})
 
 # 嘗試修復典型 mojibake：「UTF-8 被當成 latin-1 解析」
@@ -215,12 +276,9 @@ def _repair_once(s: str) -> Optional[str]:
 @app.post("/debug/repair_mojibake", summary="Attempt repair of mojibake rows")
 def debug_repair_mojibake(x_auth_token: Optional[str] = Header(default=None, alias="X-Auth-Token")):
     _guard(x_auth_token)
-    rows = cur.execute("SELECT id, content FROM memory").fetchall()
     repaired = 0
     changed_ids: List[str] = []
-    for r in rows:
-        mid = r["id"]
-        content = r["content"]
+    for mid, content in _memory_items():
         if not content:
             continue
         if _has_cjk(content):
@@ -229,7 +287,7 @@ def debug_repair_mojibake(x_auth_token: Optional[str] = Header(default=None, ali
         if _looks_mojibake(content) or not _has_cjk(content):
             new_content = _repair_once(content)
             if new_content and new_content != content:
-                cur.execute("UPDATE memory SET content=? WHERE id=?", (new_content, mid))
+                _set_memory_content(mid, new_content)
                 repaired += 1
                 changed_ids.append(mid)
     con.commit()
@@ -325,14 +383,13 @@ def bundle_export(x_auth_token: Optional[str] = Header(default=None, alias="X-Au
     _guard(x_auth_token)
     persona_row = cur.execute("SELECT v FROM kv WHERE k='persona'").fetchone()
     persona = json.loads(persona_row["v"]) if persona_row else {"name": "無蘊-敬語版"}
-    rows = cur.execute("SELECT id, content, tags, ts FROM memory ORDER BY ts DESC").fetchall()
-    mem = [_row_to_mem(r) for r in rows]
+    items = _recent_memory()
     return json_utf8({
         "ok": True,
         "bundle_version": "1.0",
         "persona": persona,
-        "memory": mem,
-        "count": len(mem),
+        "memory": items,
+        "count": len(items),
         "ts": _now()
     })
 
@@ -341,11 +398,11 @@ def bundle_preview(x_auth_token: Optional[str] = Header(default=None, alias="X-A
     _guard(x_auth_token)
     persona_row = cur.execute("SELECT v FROM kv WHERE k='persona'").fetchone()
     persona = json.loads(persona_row["v"])["name"] if persona_row else "無蘊-敬語版"
-    row = cur.execute("SELECT COUNT(*) AS c, MAX(ts) AS t FROM memory").fetchone()
+    count, latest = _memory_stats()
     return json_utf8({
         "ok": True,
         "persona": persona,
-        "count_memory": row["c"] or 0,
-        "latest_ts": row["t"],
-        "sample": [m for m in cur.execute("SELECT id, content, tags, ts FROM memory ORDER BY ts DESC LIMIT 3")],
+        "count_memory": count,
+        "latest_ts": latest,
+        "sample": _recent_memory(3),
     })    
\ No newline at end of file
@@ -0,0 +1,2 @@
+# conftest.py
+# 讓 pytest 以 repo 根目錄為匯入路徑（tests/ 內可直接 import memstore）
@@ -5,6 +5,13 @@ import streamlit as st
 st.set_page_config(page_title="OathLink 記憶 Debug", page_icon="🧠", layout="centered")
 st.title("🧠 OathLink 記憶 Debug（/memory/write ＆ /memory/search）")
 
+# 連線池：跨按鈕重用同一個 Session，避免每次點擊都重新建立 TCP/TLS 連線
+@st.cache_resource
+def get_session() -> requests.Session:
+    return requests.Session()
+
+session = get_session()
+
 # === 基本連線設定 ===
 base_url = st.text_input("Backend Base URL", "https://oathlink-backend-clean-production.up.railway.app")
 token    = st.text_input("X-Auth-Token（若後端有啟用 AUTH_TOKEN 就必填）", type="password", help="Railway Variables 內的 AUTH_TOKEN 值")
@@ -29,7 +36,7 @@ if st.button("寫入一筆記憶"):
         "tags": [t.strip() for t in mw_tags_raw.split(",") if t.strip()]
     }
     try:
-        resp = requests.post(f"{base_url}/memory/write", headers=headers, data=json.dumps(body), timeout=30)
+        resp = session.post(f"{base_url}/memory/write", headers=headers, data=json.dumps(body), timeout=30)
         st.code(resp.text, language="json")
         if resp.ok:
             rid = resp.json().get("id")
@@ -65,7 +72,7 @@ with col4:
 
 if st.button("搜尋"):
     try:
-        resp = requests.get(
+        resp = session.get(
             f"{base_url}/memory/search",
             headers=headers,
             params={"q": q, "top_k": int(top_k)},
@@ -125,21 +132,21 @@ cols = st.columns(3)
 with cols[0]:
     if st.button("檢查 /health"):
         try:
-            r = requests.get(f"{base_url}/health", timeout=15)
+            r = session.get(f"{base_url}/health", timeout=15)
             st.code(r.text, language="json")
         except Exception as e:
             st.error(f"/health 失敗：{e}")
 with cols[1]:
     if st.button("查看 /"):
         try:
-            r = requests.get(f"{base_url}/", timeout=15)
+            r = session.get(f"{base_url}/", timeout=15)
             st.code(r.text, language="json")
         except Exception as e:
             st.error(f"/ 失敗：{e}")
 with cols[2]:
     if st.button("查看 /routes"):
         try:
-            r = requests.get(f"{base_url}/routes", timeout=15)
+            r = session.get(f"{base_url}/routes", timeout=15)
             st.code(r.text, language="json")
         except Exception as e:
             st.error(f"/routes 失敗：{e}")
\ No newline at end of file
@@ -0,0 +1,515 @@
+# memstore.py
+# 純記憶體記憶引擎：陣列化儲存 + n-gram 倒排索引 + ts 排序序列
+# 持久化：append-only 日誌（JSON lines）+ 定期快照（二進位，啟動時以 mmap 載入）
+# 搜尋語意與 SQLite 版一致：content LIKE %q% OR tags LIKE %q%，ORDER BY ts DESC
+import os, sys, json, mmap, re, struct, threading
+from array import array
+from bisect import bisect_right
+from itertools import repeat
+from operator import add
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+NGRAM = 2  # 索引 1..NGRAM 字元的 gram；中文以單字／雙字詞查詢為主
+
+# 候選數超過總筆數的 1/N 時，改為依 ts 順序直接走訪驗證（命中多時 top_k 很快就滿）
+_SCAN_RATIO = 8
+
+# SQLite LIKE 只對 ASCII 做大小寫不敏感比對
+_ASCII_FOLD = {c: c + 32 for c in range(ord("A"), ord("Z") + 1)}
+
+def _fold(s: str) -> str:
+    return s.translate(_ASCII_FOLD)
+
+def _index_grams(s: str) -> set:
+    return {s[i:i + n] for n in range(1, NGRAM + 1) for i in range(len(s) - n + 1)}
+
+def _query_grams(s: str) -> set:
+    # 查詢片段取最長的 gram；不足 NGRAM 時以整段作為 gram
+    if len(s) < NGRAM:
+        return {s}
+    return {s[i:i + NGRAM] for i in range(len(s) - NGRAM + 1)}
+
+def _like_regex(q: str) -> "re.Pattern[str]":
+    # LIKE 萬用字元：% 任意長度、_ 單一字元（未指定 ESCAPE，其餘字元皆為字面）
+    parts = [".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in q]
+    return re.compile("".join(parts), re.DOTALL)
+
+# =========================
+# 快照格式
+# =========================
+# header | ts[d*n] | order[I*n] | tag_off[I*(n+1)] | tag_pool[I*npool] | odd_idx[I*nodd]
+#        | post_off[Q*(ngrams+1)] | post_pool[I*npost] | gram_off[Q*(ngrams+1)] | gram blob
+#        | str_off[Q*(ns+1)] | utf-8 blob
+# 各區段皆對齊 8 bytes。倒排索引（gram 依 UTF-8 位元組排序）留在 mmap 上二分搜尋，啟動時不重新切詞
+# 字串表順序：ids[n] + contents[n] + folded[n]（與 content 相同時為空字串）+ ftags[n]
+#             + tag_names[ntags] + odd_tags_json[nodd]
+_SNAP_MAGIC = b"OLMSNAP2"
+_SNAP_HDR = struct.Struct("<8sIIIIIQI4x")  # magic, n, ntags, npool, nodd, ngrams, npost, flags
+_FLAG_SEEDED = 1  # 已完成由 SQLite 的首次匯入
+
+def _pad8(pos: int) -> int:
+    return (pos + 7) & ~7
+
+def _arr_from(typecode: str, buf, count: int, pos: int) -> Tuple[array, int]:
+    a = array(typecode)
+    end = pos + a.itemsize * count
+    a.frombytes(buf[pos:end])
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a, _pad8(end)
+
+def _view(typecode: str, mm: mmap.mmap, count: int, pos: int):
+    # 小端機器上零拷貝；其餘平台退回複製後轉位元組序
+    size = array(typecode).itemsize * count
+    if sys.byteorder == "little":
+        return memoryview(mm)[pos:pos + size].cast(typecode), _pad8(pos + size)
+    return _arr_from(typecode, mm, count, pos)
+
+class _SnapIndex:
+    """快照上的唯讀倒排索引；gram 依 UTF-8 位元組排序，查詢時直接在 mmap 上二分搜尋。"""
+
+    def __init__(self, mm: mmap.mmap, gram_off, gram_base: int, post_off, pool):
+        self._mm, self._gram_off, self._gram_base = mm, gram_off, gram_base
+        self._post_off, self._pool = post_off, pool
+        self._n = len(gram_off) - 1
+
+    def _key(self, j: int) -> bytes:
+        b = self._gram_base
+        return self._mm[b + self._gram_off[j]:b + self._gram_off[j + 1]]
+
+    def __len__(self) -> int:
+        return self._n
+
+    def find(self, key: bytes) -> Tuple[int, bool]:
+        lo, hi = 0, self._n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo, lo < self._n and self._key(lo) == key
+
+    def get(self, g: str):
+        j, found = self.find(g.encode("utf-8"))
+        return self._pool[self._post_off[j]:self._post_off[j + 1]] if found else None
+
+    def copy_run(self, j0: int, j1: int, grams: bytearray, gram_off: array, post_off: array, pool: array):
+        # 整段複製第 j0..j1-1 個 gram（不逐筆走 Python 迴圈），位移量以 map 在 C 層套用
+        if j0 >= j1:
+            return
+        go, po, b = self._gram_off, self._post_off, self._gram_base
+        gram_off.extend(map(add, go[j0 + 1:j1 + 1], repeat(len(grams) - go[j0])))
+        grams += self._mm[b + go[j0]:b + go[j1]]
+        post_off.extend(map(add, po[j0 + 1:j1 + 1], repeat(len(pool) - po[j0])))
+        _extend_u32(pool, self._pool[po[j0]:po[j1]])
+
+def _extend_u32(dst: array, p) -> None:
+    if isinstance(p, array):
+        dst.extend(p)
+    else:
+        dst.frombytes(p.cast("B"))  # mmap 上的 memoryview：直接複製位元組
+
+def _write_arr(f, a) -> None:
+    if sys.byteorder != "little":
+        a = array(a.typecode, a)
+        a.byteswap()
+    b = a.tobytes()
+    f.write(b)
+    f.write(b"\0" * (_pad8(len(b)) - len(b)))
+
+class MemStore:
+    """記憶體內記憶庫，供 FastAPI threadpool 併發呼叫。
+
+    兩把鎖：_log_lock 序列化寫入（日誌寫入與 fsync 在此鎖內），_lock 只保護記憶體結構，
+    寫入者僅在套用變更時短暫持有，搜尋不必等待磁碟。鎖順序固定為 _log_lock → _lock。
+    快照在背景執行緒寫出：鎖內只複製欄位參照並輪替日誌，編碼與 fsync 皆在鎖外進行。
+    """
+
+    def __init__(self, path: str, snapshot_every: int = 1000, fsync: bool = True):
+        self.snap_path = path + ".snap"
+        self.log_path = path + ".log"
+        self.old_log_path = path + ".old.log"  # 背景快照期間，已輪替但尚未被快照涵蓋的日誌
+        self.snapshot_every = max(1, snapshot_every)
+        self.fsync = fsync
+        self.seeded = False
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._snap_thread: Optional[threading.Thread] = None
+        self._pending = 0  # 上次快照後的日誌筆數
+        self._clear()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._load_snapshot()
+        self._replay_log(self.old_log_path)
+        self._replay_log(self.log_path)
+        self._log = open(self.log_path, "ab")
+        if os.path.exists(self.old_log_path):
+            # 上次背景快照未完成：以目前完整狀態重寫快照後清掉兩份日誌
+            self._snapshot_sync()
+
+    # -------------------------
+    # 內部結構
+    # -------------------------
+    def _clear(self):
+        self._ids: List[str] = []
+        self._pos: Dict[str, int] = {}
+        self._content: List[str] = []
+        self._folded: List[str] = []           # 與 content 相同時共用同一物件
+        self._ftags: List[str] = []            # ASCII 摺疊後的 tags JSON（LIKE 比對對象）
+        self._ts = array("d")
+        self._tag_off = array("I", [0])         # 第 i 筆的 tags 為 tag_pool[tag_off[i]:tag_off[i+1]]
+        self._tag_pool = array("I")
+        self._tag_names: List[str] = []
+        self._tag_ids: Dict[str, int] = {}
+        self._odd_tags: Dict[int, str] = {}     # tags 非字串清單時（如 bundle 匯入）保留原始 JSON
+        self._base: Optional[_SnapIndex] = None  # 快照載入的唯讀索引
+        self._postings: Dict[str, array] = {}   # 快照之後新增／變動的 gram（含 base 內容的副本）
+        self._order = array("I")                # 依 (ts DESC, 寫入順序 ASC) 排列
+
+    def _intern(self, tag: str) -> int:
+        tid = self._tag_ids.get(tag)
+        if tid is None:
+            tid = len(self._tag_names)
+            self._tag_ids[tag] = tid
+            self._tag_names.append(tag)
+        return tid
+
+    def _tags_of(self, i: int) -> Any:
+        odd = self._odd_tags.get(i)
+        if odd is not None:
+            return json.loads(odd)
+        names = self._tag_names
+        return [names[t] for t in self._tag_pool[self._tag_off[i]:self._tag_off[i + 1]]]
+
+    def _tags_json(self, i: int) -> str:
+        odd = self._odd_tags.get(i)
+        if odd is not None:
+            return odd
+        return json.dumps(self._tags_of(i), ensure_ascii=False)
+
+    def _posting(self, g: str):
+        p = self._postings.get(g)
+        if p is None and self._base is not None:
+            p = self._base.get(g)
+        return p
+
+    def _index(self, i: int, text: str):
+        postings, base = self._postings, self._base
+        for g in _index_grams(text):
+            p = postings.get(g)
+            if p is None:
+                p = postings[g] = array("I")
+                b = base.get(g) if base is not None else None
+                if b is not None:  # 快照上的 posting 第一次被寫入時才複製
+                    _extend_u32(p, b)
+            if not p or p[-1] != i:
+                p.append(i)
+
+    def _apply_put(self, mid: str, content: str, tags: Any, ts: float):
+        if mid in self._pos:  # 快照與日誌重疊時重放需冪等
+            return
+        i = len(self._ids)
+        self._ids.append(mid)
+        self._pos[mid] = i
+        self._content.append(content)
+        self._ts.append(ts)
+        if isinstance(tags, list) and all(isinstance(t, str) for t in tags):
+            self._tag_pool.extend(self._intern(t) for t in tags)
+        else:
+            self._odd_tags[i] = json.dumps(tags, ensure_ascii=False)
+        self._tag_off.append(len(self._tag_pool))
+        folded = _fold(content)
+        self._folded.append(content if folded == content else folded)
+        tags_json = self._tags_json(i)
+        ftags = _fold(tags_json)
+        self._ftags.append(tags_json if ftags == tags_json else ftags)
+        self._index(i, folded)
+        self._index(i, ftags)
+        ts_arr = self._ts
+        self._order.insert(bisect_right(self._order, -ts, key=lambda j: -ts_arr[j]), i)
+
+    def _apply_set_content(self, mid: str, content: str):
+        i = self._pos.get(mid)
+        if i is None:
+            return
+        self._content[i] = content
+        folded = _fold(content)
+        self._folded[i] = content if folded == content else folded
+        # 舊 gram 的 posting 不移除：搜尋時一律再驗證，多餘候選只會被濾掉
+        self._index(i, folded)
+
+    def _apply(self, op: Dict[str, Any]):
+        kind = op.get("op")
+        if kind == "put":
+            self._apply_put(op["id"], op["content"], op["tags"], float(op["ts"]))
+        elif kind == "set_content":
+            self._apply_set_content(op["id"], op["content"])
+        elif kind == "reset":
+            self._clear()
+
+    # -------------------------
+    # 持久化
+    # -------------------------
+    def _append(self, op: Dict[str, Any]):
+        # _log_lock 內呼叫。先寫日誌再套用：寫入失敗時記憶體狀態不變；截掉半行，避免汙染後續紀錄
+        line = (json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        pos = self._log.tell()
+        try:
+            self._log.write(line)
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+        except Exception:
+            try:
+                self._log.truncate(pos)
+            except Exception:
+                pass
+            raise
+        self._pending += 1
+
+    def _commit(self, op: Dict[str, Any]):
+        # 日誌落地期間只持有 _log_lock，搜尋照常進行；_log_lock 亦保證套用順序與日誌一致
+        with self._log_lock:
+            self._append(op)
+            with self._lock:
+                self._apply(op)
+                self._maybe_snapshot()
+
+    def _replay_log(self, path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    op = json.loads(line.decode("utf-8"))
+                except Exception:
+                    continue  # 當機時寫到一半的行直接略過
+                self._apply(op)
+                self._pending += 1
+
+    def _load_snapshot(self):
+        if not os.path.exists(self.snap_path) or os.path.getsize(self.snap_path) < _SNAP_HDR.size:
+            return
+        with open(self.snap_path, "rb") as f:
+            # mmap 於關閉檔案後仍有效；posting 的 memoryview 會保持其存活
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, ntags, npool, nodd, ngrams, npost, flags = _SNAP_HDR.unpack_from(mm, 0)
+        if magic != _SNAP_MAGIC:
+            raise ValueError(f"invalid snapshot: {self.snap_path}")
+        pos = _pad8(_SNAP_HDR.size)
+        ts, pos = _arr_from("d", mm, n, pos)
+        order, pos = _arr_from("I", mm, n, pos)
+        tag_off, pos = _arr_from("I", mm, n + 1, pos)
+        tag_pool, pos = _arr_from("I", mm, npool, pos)
+        odd_idx, pos = _arr_from("I", mm, nodd, pos)
+        post_off, pos = _view("Q", mm, ngrams + 1, pos)
+        post_pool, pos = _view("I", mm, npost, pos)
+        gram_off, pos = _view("Q", mm, ngrams + 1, pos)
+        self._base = _SnapIndex(mm, gram_off, pos, post_off, post_pool)
+        pos = _pad8(pos + gram_off[ngrams])
+        ns = 4 * n + ntags + nodd
+        str_off, pos = _arr_from("Q", mm, ns + 1, pos)
+        strs = [mm[pos + str_off[k]:pos + str_off[k + 1]].decode("utf-8") for k in range(ns)]
+
+        self.seeded = bool(flags & _FLAG_SEEDED)
+        self._ids = strs[:n]
+        self._pos = {mid: i for i, mid in enumerate(self._ids)}
+        self._content = strs[n:2 * n]
+        self._folded = [f or c for f, c in zip(strs[2 * n:3 * n], self._content)]
+        self._ftags = strs[3 * n:4 * n]
+        k = 4 * n
+        self._tag_names = strs[k:k + ntags]
+        self._tag_ids = {t: j for j, t in enumerate(self._tag_names)}
+        self._odd_tags = dict(zip(odd_idx, strs[k + ntags:]))
+        self._ts, self._order, self._tag_off, self._tag_pool = ts, order, tag_off, tag_pool
+
+    def _capture(self) -> Dict[str, Any]:
+        # _lock 內呼叫：只複製欄位參照與長度，編碼留到鎖外。
+        # posting 只會被 append（reset 則換新 dict），記下長度即可在鎖外安全切片；base 為唯讀
+        odd_idx = array("I", sorted(self._odd_tags))
+        return {
+            "ids": self._ids[:], "content": self._content[:], "folded": self._folded[:], "ftags": self._ftags[:],
+            "tag_names": self._tag_names[:], "odd_idx": odd_idx, "odd": [self._odd_tags[i] for i in odd_idx],
+            "ts": self._ts[:], "order": self._order[:], "tag_off": self._tag_off[:], "tag_pool": self._tag_pool[:],
+            "base": self._base,
+            "postings": [(g, p, len(p)) for g, p in self._postings.items()],
+            "seeded": self.seeded,
+        }
+
+    def _write_snapshot(self, st: Dict[str, Any]):
+        n = len(st["ids"])
+        folded = ["" if f is c or f == c else f for f, c in zip(st["folded"], st["content"])]
+        strs = st["ids"] + st["content"] + folded + st["ftags"] + st["tag_names"] + st["odd"]
+        blobs = [s.encode("utf-8") for s in strs]
+        str_off = array("Q", [0])
+        for b in blobs:
+            str_off.append(str_off[-1] + len(b))
+
+        # 合併 base 與變動的 posting（兩者皆依 UTF-8 位元組排序；同 gram 以變動者為準）
+        # 逐筆處理的只有變動的 gram，其間未變動的 base 區段整段複製
+        delta = sorted(((g.encode("utf-8"), p[:ln]) for g, p, ln in st["postings"]), key=lambda t: t[0])
+        base = st["base"]
+        grams, gram_off, post_off, pool = bytearray(), array("Q", [0]), array("Q", [0]), array("I")
+        ngrams = 0
+        j = 0  # 下一個尚未複製的 base gram
+        for key, p in delta:
+            if base is not None:
+                k, found = base.find(key)
+                base.copy_run(j, k, grams, gram_off, post_off, pool)
+                ngrams += k - j
+                j = k + 1 if found else k
+            grams += key
+            gram_off.append(len(grams))
+            _extend_u32(pool, p)
+            post_off.append(len(pool))
+            ngrams += 1
+        if base is not None:
+            base.copy_run(j, len(base), grams, gram_off, post_off, pool)
+            ngrams += len(base) - j
+
+        tmp = self.snap_path + ".tmp"
+        with open(tmp, "wb") as f:
+            hdr = _SNAP_HDR.pack(_SNAP_MAGIC, n, len(st["tag_names"]), len(st["tag_pool"]), len(st["odd_idx"]),
+                                 ngrams, len(pool), _FLAG_SEEDED if st["seeded"] else 0)
+            f.write(hdr + b"\0" * (_pad8(len(hdr)) - len(hdr)))
+            for a in (st["ts"], st["order"], st["tag_off"], st["tag_pool"], st["odd_idx"], post_off, pool, gram_off):
+                _write_arr(f, a)
+            f.write(grams + b"\0" * (_pad8(len(grams)) - len(grams)))
+            _write_arr(f, str_off)
+            f.write(b"".join(blobs))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snap_path)
+
+    def _maybe_snapshot(self):
+        # 兩把鎖內呼叫：複製狀態並輪替日誌，之後的寫入落在新日誌；快照完成後才刪除舊日誌
+        if self._pending < self.snapshot_every or self._snap_thread is not None:
+            return
+        if os.path.exists(self.old_log_path):
+            return  # 上一次背景快照失敗，舊日誌仍需保留；待重啟時補寫
+        state = self._capture()
+        self._log.close()
+        os.replace(self.log_path, self.old_log_path)
+        self._log = open(self.log_path, "ab")
+        self._pending = 0
+        self._snap_thread = threading.Thread(target=self._snapshot_bg, args=(state,), daemon=True)
+        self._snap_thread.start()
+
+    def _snapshot_bg(self, state: Dict[str, Any]):
+        try:
+            self._write_snapshot(state)
+            os.remove(self.old_log_path)
+        finally:
+            with self._lock:
+                self._snap_thread = None
+
+    def _snapshot_sync(self):
+        # 兩把鎖內（或初始化時）且無背景快照時呼叫：快照涵蓋全部狀態，兩份日誌皆可清除
+        self._write_snapshot(self._capture())
+        self._log.truncate(0)
+        self._log.seek(0)
+        if os.path.exists(self.old_log_path):
+            os.remove(self.old_log_path)
+        self._pending = 0
+
+    def _exclusive(self, fn):
+        # 等背景快照結束後，在兩把鎖內執行 fn（避免與背景快照同時寫 .snap.tmp）
+        while True:
+            with self._log_lock, self._lock:
+                t = self._snap_thread
+                if t is None:
+                    return fn()
+            t.join()
+
+    def close(self):
+        def _close():
+            if self._log.closed:
+                return
+            if self._pending or os.path.exists(self.old_log_path):
+                self._snapshot_sync()
+            self._log.close()
+        self._exclusive(_close)
+
+    # -------------------------
+    # 讀寫介面（對應 app.py 的 SQL 操作）
+    # -------------------------
+    def put(self, mid: str, content: str, tags: Any, ts: float):
+        self._commit({"op": "put", "id": mid, "content": content, "tags": tags, "ts": ts})
+
+    def bulk_put(self, mems: List[Dict[str, Any]]):
+        # 由 SQLite 首次匯入：逐筆套用後只寫一次快照（不逐筆 fsync），並標記 seeded
+        def _bulk():
+            for m in mems:
+                self._apply_put(m["id"], m["content"], m["tags"], float(m["ts"]))
+            self.seeded = True
+            self._snapshot_sync()
+        self._exclusive(_bulk)
+
+    def set_content(self, mid: str, content: str):
+        self._commit({"op": "set_content", "id": mid, "content": content})
+
+    def reset(self):
+        # reset 亦寫入日誌：即使快照尚未更新就當機，重放時同樣會清空；seeded 標記保留
+        self._commit({"op": "reset"})
+
+    def _mem(self, i: int) -> Dict[str, Any]:
+        return {"id": self._ids[i], "content": self._content[i], "tags": self._tags_of(i), "ts": self._ts[i]}
+
+    def _candidates(self, qf: str):
+        # 取最稀有的 gram 之 posting 當候選（僅為超集，仍需驗證）；
+        # 查詢只有萬用字元時回傳 None（全表依序走訪）
+        segs = [s for s in re.split(r"[%_]", qf) if s]
+        if not segs:
+            return None
+        best = None
+        for seg in segs:
+            for g in _query_grams(seg):
+                p = self._posting(g)
+                if p is None:
+                    return ()
+                if best is None or len(p) < len(best):
+                    best = p
+        return best
+
+    def search(self, q: str, top_k: int) -> List[Dict[str, Any]]:
+        qf = _fold(q)
+        if "%" in qf or "_" in qf:
+            rx = _like_regex(qf)
+            match = lambda s: rx.search(s) is not None
+        else:
+            match = lambda s: qf in s
+        top_k = max(1, top_k)
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            cands = self._candidates(qf)
+            if cands is None or len(cands) * _SCAN_RATIO > len(self._ids):
+                seq = self._order
+            else:
+                ts = self._ts
+                # set_content 重新索引可能在 posting 留下重複項
+                seq = sorted(set(cands), key=lambda j: (-ts[j], j))
+            folded, ftags = self._folded, self._ftags
+            for i in seq:
+                if match(folded[i]) or match(ftags[i]):
+                    out.append(self._mem(i))
+                    if len(out) >= top_k:
+                        break
+        return out
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            order = self._order if limit is None else self._order[:limit]
+            return [self._mem(i) for i in order]
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        with self._lock:
+            return iter(list(zip(self._ids, self._content)))
+
+    def stats(self) -> Tuple[int, Optional[float]]:
+        with self._lock:
+            return len(self._ids), (self._ts[self._order[0]] if self._order else None)
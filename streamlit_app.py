@@ -1,5 +1,9 @@
-import json, requests, unicodedata
+import json, requests, unicodedata, time, random, itertools, threading, math
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 import streamlit as st
+from requests.adapters import HTTPAdapter
 
 st.set_page_config(page_title="OathLink /compose 即時測試", layout="centered")
 
@@ -16,25 +20,28 @@ show_raw = st.sidebar.checkbox("顯示原始 JSON", value=False)
 
 st.title("🧪 OathLink /compose 即時測試")
 
-# ---- 輸入區 ----
-input_text = st.text_area("問題／指令（必填）", height=140, placeholder="請條列三點進度，並標註下一步")
-tags_str = st.text_input("Tags（逗號分隔，可留空）", value="clean,demo")
-top_k = st.slider("top_k", min_value=1, max_value=20, value=5)
-
-col_run, col_sample = st.columns([1,1])
-with col_sample:
-    if st.button("載入示例"):
-        st.session_state["input_text"] = "請條列三點進度，並標註下一步"
-        st.session_state["tags_str"] = "clean,demo"
-        st.rerun()
-
-# 從 session 還原示例（若有）
-if "input_text" in st.session_state:
-    input_text = st.session_state.pop("input_text")
-    st.session_state["input_text_applied"] = input_text
-if "tags_str" in st.session_state:
-    tags_str = st.session_state.pop("tags_str")
-    st.session_state["tags_str_applied"] = tags_str
+# ---- 連線池：重用 Session（保留 TCP/TLS 連線） ----
+def pooled_session(pool_size: int) -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    # 單次呼叫（/compose）共用
+    return pooled_session(10)
+
+def get_perf_session(pool_size: int) -> requests.Session:
+    # 壓測用：每個瀏覽器 session 各自一個連線池，多位操作者同時壓測不會互相干擾；併發數變更時換新
+    size, s = st.session_state.get("perf_session", (None, None))
+    if s is None or size != pool_size:
+        if s is not None:
+            s.close()
+        s = pooled_session(pool_size)
+        st.session_state["perf_session"] = (pool_size, s)
+    return s
 
 def to_tags(s: str):
     if not s: return None
@@ -50,74 +57,324 @@ def call_compose(base: str, token: str | None, text: str, tags: list[str] | None
     if tags:
         payload["tags"] = tags
     data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-    r = requests.post(url, headers=headers, data=data, timeout=timeout)
+    r = get_session().post(url, headers=headers, data=data, timeout=timeout)
     # 優先回傳伺服器原文錯誤
     r.raise_for_status()
     return r.json()
 
-with col_run:
-    clicked = st.button("🚀 呼叫 /compose")
-if clicked:
-    if not base_url.strip():
-        st.error("請先填 Base URL")
-    elif not input_text.strip():
-        st.error("請先輸入問題／指令")
+# ---- 性能測試 ----
+PERF_OPS = ("write", "search", "compose")
+
+def perf_request(session: requests.Session, base: str, token: str | None, op: str, n: int, query: str, k: int, timeout: int) -> bool:
+    base = base.rstrip("/")
+    headers = {"Content-Type": "application/json; charset=utf-8"}
+    if token:
+        headers["X-Auth-Token"] = token
+    if op == "write":
+        payload = {"content": f"loadtest #{n} {query}", "tags": ["loadtest"]}
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        r = session.post(base + "/memory/write", headers=headers, data=data, timeout=timeout)
+    elif op == "search":
+        r = session.get(base + "/memory/search", headers=headers, params={"q": query, "top_k": k}, timeout=timeout)
+    else:
+        data = json.dumps({"input": query, "top_k": k}, ensure_ascii=False).encode("utf-8")
+        r = session.post(base + "/compose", headers=headers, data=data, timeout=timeout)
+    return r.ok
+
+def run_load(session: requests.Session, base: str, token: str | None, weights: dict, concurrency: int,
+             duration: int, query: str, k: int, timeout: int, rec: "PerfRecorder", stop: threading.Event):
+    # 每個 worker 持續送出請求直到時限或 stop 被設定；結果記入 rec 的每秒桶
+    ops = [op for op in PERF_OPS if weights[op] > 0]
+    w = [weights[op] for op in ops]
+    counter = itertools.count()
+    deadline = rec.t0 + duration
+
+    def worker():
+        rnd = random.Random()
+        while not stop.is_set() and time.perf_counter() < deadline:
+            op = rnd.choices(ops, w)[0]
+            start = time.perf_counter()
+            try:
+                ok = perf_request(session, base, token, op, next(counter), query, k, timeout)
+            except requests.RequestException:
+                ok = False
+            end = time.perf_counter()
+            rec.record(end, op, (end - start) * 1000, ok)
+
+    ex = ThreadPoolExecutor(max_workers=concurrency)
+    futures = [ex.submit(worker) for _ in range(concurrency)]
+    ex.shutdown(wait=False)
+    return futures
+
+# 延遲直方圖：對數分箱（相鄰箱差 2%），整體百分位由直方圖估算，不保留原始樣本
+_LAT_STEP = math.log(1.02)
+
+def _lat_bin(ms: float) -> int:
+    return math.floor(math.log(max(ms, 1e-3)) / _LAT_STEP)
+
+def _hist_pct(hist: Counter, q: float) -> float:
+    need, acc = q * sum(hist.values()), 0
+    for b in sorted(hist):
+        acc += hist[b]
+        if acc >= need:
+            return math.exp((b + 0.5) * _LAT_STEP)
+    return float("nan")
+
+def _pct(sorted_vals: list, q: float) -> float:
+    if not sorted_vals:
+        return float("nan")
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+class PerfRecorder:
+    """壓測結果的增量彙總。
+
+    worker 只做 O(1) 的 append，樣本依完成秒數分桶；刷新時只處理上次之後已結束的秒，
+    處理完即丟棄該秒的原始樣本，因此每次刷新的成本與總樣本數無關。
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.buckets: dict = {}      # 秒 -> [(op, 延遲 ms, 成功)]
+        self.next_sec = 0            # 下一個尚未彙總的秒
+        self.covered = 0.0           # 已彙總的時間長度（秒），rps 的分母
+        self.rows: list = []         # 每秒一列；沒有請求完成的秒也會有一列（rps=0）
+        self.hist = {op: Counter() for op in ("all",) + PERF_OPS}
+        self.count = Counter()
+        self.errors = Counter()
+
+    def record(self, end: float, op: str, ms: float, ok: bool):
+        # dict.setdefault 與 list.append 在 GIL 下皆為原子操作
+        self.buckets.setdefault(int(end - self.t0), []).append((op, ms, ok))
+
+    def _absorb(self, items: list):
+        for op, ms, ok in items:
+            b = _lat_bin(ms)
+            for key in ("all", op):
+                self.hist[key][b] += 1
+                self.count[key] += 1
+                if not ok:
+                    self.errors[key] += 1
+
+    def update(self, final: bool = False):
+        # 即時刷新時保留最後一秒緩衝（仍可能有樣本寫入）；結束時全部彙總
+        elapsed = time.perf_counter() - self.t0
+        upto = int(elapsed) + 1 if final else int(elapsed) - 1
+        for sec in range(self.next_sec, upto):
+            items = self.buckets.pop(sec, [])
+            lat = sorted(ms for _, ms, _ in items)
+            self.rows.append({
+                "sec": sec,
+                "rps": len(items),
+                "p50": _pct(lat, 0.50),
+                "p95": _pct(lat, 0.95),
+                "p99": _pct(lat, 0.99),
+            })
+            self._absorb(items)
+        self.next_sec = max(self.next_sec, upto)
+        self.covered = elapsed if final else float(self.next_sec)
+        if final:  # 極少數在該秒彙總後才寫入的樣本：只計入總計
+            for sec in list(self.buckets):
+                self._absorb(self.buckets.pop(sec))
+
+    def timeseries(self) -> pd.DataFrame:
+        return pd.DataFrame(self.rows, columns=["sec", "rps", "p50", "p95", "p99"]).set_index("sec")
+
+    def summary(self) -> pd.DataFrame:
+        rows = []
+        for op in ("all",) + PERF_OPS:
+            n = self.count[op]
+            if not n:
+                continue
+            h = self.hist[op]
+            rows.append({
+                "op": op,
+                "requests": n,
+                "errors": self.errors[op],
+                "rps": round(n / max(self.covered, 1e-9), 1),
+                "p50_ms": round(_hist_pct(h, 0.50), 1),
+                "p95_ms": round(_hist_pct(h, 0.95), 1),
+                "p99_ms": round(_hist_pct(h, 0.99), 1),
+            })
+        return pd.DataFrame(rows).set_index("op") if rows else pd.DataFrame()
+
+def perf_aggregate(url: str, rec: PerfRecorder) -> dict:
+    # session_state 只保留彙總結果，不保留原始樣本
+    if not rec.count["all"]:
+        return {"url": url, "timeseries": None, "summary": None}
+    return {"url": url, "timeseries": rec.timeseries(), "summary": rec.summary()}
+
+def draw_perf(holder, label: str, run: dict):
+    with holder.container():
+        st.markdown(f"**{label}** `{run['url']}`")
+        summary, ts = run["summary"], run["timeseries"]
+        if summary is None:
+            st.caption("（等待第一筆回應…）")
+            return
+        total = summary.loc["all"]
+        m = st.columns(3)
+        m[0].metric("rps", total["rps"])
+        m[1].metric("p95 ms", total["p95_ms"])
+        m[2].metric("errors", int(total["errors"]))
+        st.caption("吞吐量（每秒完成請求數）")
+        st.line_chart(ts[["rps"]], height=180)
+        st.caption("延遲百分位（ms）")
+        st.line_chart(ts[["p50", "p95", "p99"]], height=180)
+        st.dataframe(summary, use_container_width=True)
+
+tab_compose, tab_perf = st.tabs(["🚀 /compose", "📈 性能"])
+
+with tab_compose:
+    # ---- 輸入區 ----
+    input_text = st.text_area("問題／指令（必填）", height=140, placeholder="請條列三點進度，並標註下一步")
+    tags_str = st.text_input("Tags（逗號分隔，可留空）", value="clean,demo")
+    top_k = st.slider("top_k", min_value=1, max_value=20, value=5)
+
+    col_run, col_sample = st.columns([1,1])
+    with col_sample:
+        if st.button("載入示例"):
+            st.session_state["input_text"] = "請條列三點進度，並標註下一步"
+            st.session_state["tags_str"] = "clean,demo"
+            st.rerun()
+
+    # 從 session 還原示例（若有）
+    if "input_text" in st.session_state:
+        input_text = st.session_state.pop("input_text")
+        st.session_state["input_text_applied"] = input_text
+    if "tags_str" in st.session_state:
+        tags_str = st.session_state.pop("tags_str")
+        st.session_state["tags_str_applied"] = tags_str
+
+    with col_run:
+        clicked = st.button("🚀 呼叫 /compose")
+    if clicked:
+        if not base_url.strip():
+            st.error("請先填 Base URL")
+        elif not input_text.strip():
+            st.error("請先輸入問題／指令")
+        else:
+            try:
+                tags = to_tags(tags_str)
+                resp = call_compose(base_url, auth_token, input_text.strip(), tags, top_k, timeout_s)
+
+                st.success("✅ /compose 呼叫成功")
+                # 顯示主要輸出
+                st.subheader("回覆 output")
+                # 有些環境回來可能帶有亂碼，但 Streamlit 端顯示多為正常中文
+                out = resp.get("output", "")
+                # 嘗試規範化（對個別字元異常較友善）
+                out = unicodedata.normalize("NFC", out)
+                st.write(out)
+
+                # 顯示命中記憶
+                hits = resp.get("context_hits") or []
+                st.markdown("**命中記憶（context_hits）**")
+                if hits:
+                    for i, h in enumerate(hits, 1):
+                        with st.expander(f"Hit #{i} — {h.get('id','')[:8]}…"):
+                            st.write(f"**content**: {h.get('content','')}")
+                            st.write(f"**tags**: {h.get('tags',[])}")
+                            st.write(f"**ts**: {h.get('ts')}")
+                else:
+                    st.caption("（無）")
+
+                # 顯示 prompt（system / user）
+                with st.expander("查看 prompt（system / user）"):
+                    p = resp.get("prompt", {})
+                    st.code(p.get("system", ""), language="text")
+                    st.code(p.get("user", ""), language="text")
+
+                # 顯示 model / search mode
+                meta_cols = st.columns(3)
+                meta_cols[0].metric("model_used", str(resp.get("model_used")))
+                meta_cols[1].metric("search_mode", str(resp.get("search_mode", "default")))
+                meta_cols[2].metric("ok", str(resp.get("ok")))
+
+                # 原始 JSON
+                if show_raw:
+                    st.subheader("Raw JSON")
+                    st.json(resp)
+
+                # 方便複製的 curl
+                with st.expander("複製 cURL（重現同一請求）"):
+                    curl_headers = f'-H "Content-Type: application/json; charset=utf-8"'
+                    if auth_token:
+                        curl_headers += f' -H "X-Auth-Token: {auth_token}"'
+                    curl = (
+                        f'curl -X POST "{base_url.rstrip("/")}/compose" '
+                        f'{curl_headers} '
+                        f"-d '{json.dumps({'input': input_text.strip(), 'tags': tags or [], 'top_k': top_k}, ensure_ascii=False)}'"
+                    )
+                    st.code(curl, language="bash")
+
+            except requests.HTTPError as he:
+                st.error(f"HTTP {he.response.status_code}：{he.response.text}")
+            except Exception as e:
+                st.error(f"請求失敗：{e}")
+
+with tab_perf:
+    st.caption("以連線池併發送出 write / search / compose，觀察吞吐量與延遲；填入 URL B 可並排比較兩個部署或版本。")
+    base_url_b = st.text_input("比較用 Base URL B（可留空）", value="")
+    pc = st.columns(3)
+    concurrency = pc[0].number_input("併發數", min_value=1, max_value=64, value=8)
+    duration = pc[1].number_input("每個目標持續秒數", min_value=3, max_value=300, value=15)
+    perf_top_k = pc[2].number_input("top_k", min_value=1, max_value=100, value=5, key="perf_top_k")
+    wc = st.columns(3)
+    weights = {
+        "write": wc[0].slider("write 比重", 0, 10, 1),
+        "search": wc[1].slider("search 比重", 0, 10, 8),
+        "compose": wc[2].slider("compose 比重", 0, 10, 1),
+    }
+    perf_query = st.text_input("search / compose 查詢字串", value="清單測試")
+    if weights["write"]:
+        st.warning("write 會在目標後端寫入 tags=[\"loadtest\"] 的記憶。")
+
+    targets = [("A", base_url.strip())]
+    if base_url_b.strip():
+        targets.append(("B", base_url_b.strip()))
+    # 任何一次重跑（改參數、按停止、切換頁面）都代表上一輪的即時迴圈已中斷：先停掉其 worker
+    prev_stop = st.session_state.get("perf_stop")
+    if prev_stop is not None:
+        prev_stop.set()
+    bc = st.columns(2)
+    run_perf = bc[0].button("▶️ 開始壓測")
+    bc[1].button("⏹️ 停止")  # 觸發重跑即會停止進行中的壓測
+    cols = st.columns(len(targets))
+    holders = {label: col.empty() for (label, _), col in zip(targets, cols)}
+
+    if run_perf:
+        if not base_url.strip():
+            st.error("請先填 Base URL")
+        elif not sum(weights.values()):
+            st.error("請至少設定一種請求的比重")
+        else:
+            session = get_perf_session(int(concurrency))
+            stop = threading.Event()
+            st.session_state["perf_stop"] = stop
+            # 每次刷新都寫回彙總結果，中途被重跑打斷時仍保留已完成的部分
+            runs = st.session_state["perf_runs"] = {}
+            # 依序壓測各目標，避免兩者互搶本機頻寬／CPU 而失真
+            for label, url in targets:
+                rec = PerfRecorder()
+                futures = run_load(session, url, auth_token, weights, int(concurrency), int(duration),
+                                   perf_query, int(perf_top_k), int(timeout_s), rec, stop)
+                while not all(f.done() for f in futures):
+                    rec.update()
+                    runs[label] = perf_aggregate(url, rec)
+                    draw_perf(holders[label], label, runs[label])
+                    time.sleep(0.5)
+                rec.update(final=True)
+                runs[label] = perf_aggregate(url, rec)
+                draw_perf(holders[label], label, runs[label])
     else:
-        try:
-            tags = to_tags(tags_str)
-            resp = call_compose(base_url, auth_token, input_text.strip(), tags, top_k, timeout_s)
-
-            st.success("✅ /compose 呼叫成功")
-            # 顯示主要輸出
-            st.subheader("回覆 output")
-            # 有些環境回來可能帶有亂碼，但 Streamlit 端顯示多為正常中文
-            out = resp.get("output", "")
-            # 嘗試規範化（對個別字元異常較友善）
-            out = unicodedata.normalize("NFC", out)
-            st.write(out)
-
-            # 顯示命中記憶
-            hits = resp.get("context_hits") or []
-            st.markdown("**命中記憶（context_hits）**")
-            if hits:
-                for i, h in enumerate(hits, 1):
-                    with st.expander(f"Hit #{i} — {h.get('id','')[:8]}…"):
-                        st.write(f"**content**: {h.get('content','')}")
-                        st.write(f"**tags**: {h.get('tags',[])}")
-                        st.write(f"**ts**: {h.get('ts')}")
-            else:
-                st.caption("（無）")
-
-            # 顯示 prompt（system / user）
-            with st.expander("查看 prompt（system / user）"):
-                p = resp.get("prompt", {})
-                st.code(p.get("system", ""), language="text")
-                st.code(p.get("user", ""), language="text")
-
-            # 顯示 model / search mode
-            meta_cols = st.columns(3)
-            meta_cols[0].metric("model_used", str(resp.get("model_used")))
-            meta_cols[1].metric("search_mode", str(resp.get("search_mode", "default")))
-            meta_cols[2].metric("ok", str(resp.get("ok")))
-
-            # 原始 JSON
-            if show_raw:
-                st.subheader("Raw JSON")
-                st.json(resp)
-
-            # 方便複製的 curl
-            with st.expander("複製 cURL（重現同一請求）"):
-                curl_headers = f'-H "Content-Type: application/json; charset=utf-8"'
-                if auth_token:
-                    curl_headers += f' -H "X-Auth-Token: {auth_token}"'
-                curl = (
-                    f'curl -X POST "{base_url.rstrip("/")}/compose" '
-                    f'{curl_headers} '
-                    f"-d '{json.dumps({'input': input_text.strip(), 'tags': tags or [], 'top_k': top_k}, ensure_ascii=False)}'"
-                )
-                st.code(curl, language="bash")
-
-        except requests.HTTPError as he:
-            st.error(f"HTTP {he.response.status_code}：{he.response.text}")
-        except Exception as e:
-            st.error(f"請求失敗：{e}")
\ No newline at end of file
+        for label, run in st.session_state.get("perf_runs", {}).items():
+            if label in holders:
+                draw_perf(holders[label], label, run)
+
+    runs = st.session_state.get("perf_runs", {})
+    if "A" in runs and "B" in runs:
+        st.subheader("A / B 比較（全部請求）")
+        a, b = runs["A"]["summary"], runs["B"]["summary"]
+        if a is not None and b is not None:
+            cmp = pd.DataFrame({"A": a.loc["all"], "B": b.loc["all"]})
+            cmp["B / A"] = (cmp["B"] / cmp["A"].replace(0, float("nan"))).round(2)
+            st.dataframe(cmp, use_container_width=True)
@@ -0,0 +1,227 @@
+# tests/test_memstore_parity.py
+# memory 引擎（memstore.MemStore）與 SQLite 引擎（app.py 的 memory 表 + LIKE 查詢）結果一致性測試
+import json, os, random, shutil, sqlite3, threading, uuid
+
+import pytest
+
+import memstore
+from memstore import MemStore
+
+# 與 app.py 相同的 schema 與查詢
+def sql_conn() -> sqlite3.Connection:
+    con = sqlite3.connect(":memory:")
+    con.row_factory = sqlite3.Row
+    con.execute("CREATE TABLE memory (id TEXT PRIMARY KEY, content TEXT NOT NULL, tags TEXT, ts REAL NOT NULL)")
+    return con
+
+def _row_to_mem(r: sqlite3.Row) -> dict:
+    return {"id": r["id"], "content": r["content"], "tags": json.loads(r["tags"] or "[]"), "ts": r["ts"]}
+
+def sql_search(con, q: str, top_k: int) -> list:
+    like = f"%{q}%"
+    rows = con.execute(
+        "SELECT id, content, tags, ts FROM memory WHERE content LIKE ? OR tags LIKE ? ORDER BY ts DESC LIMIT ?",
+        (like, like, max(1, top_k)),
+    ).fetchall()
+    return [_row_to_mem(r) for r in rows]
+
+def sql_recent(con, limit=None) -> list:
+    if limit is None:
+        rows = con.execute("SELECT id, content, tags, ts FROM memory ORDER BY ts DESC").fetchall()
+    else:
+        rows = con.execute("SELECT id, content, tags, ts FROM memory ORDER BY ts DESC LIMIT ?", (limit,)).fetchall()
+    return [_row_to_mem(r) for r in rows]
+
+def sql_stats(con) -> tuple:
+    row = con.execute("SELECT COUNT(*) AS c, MAX(ts) AS t FROM memory").fetchone()
+    return row["c"] or 0, row["t"]
+
+# 大小寫 ASCII、CJK、LIKE 萬用字元、JSON 特殊字元、非 ASCII 大寫（SQLite 不摺疊）
+ALPHABET = list("abcABCk願主清單測試記憶%_ \n,\"[]") + ["İ", "i", "é", "É"]
+QUERIES = [
+    "a", "A", "abc", "ABC", "Ab", "k", "K", '"k"', '["k"', "願", "願主", "清單測試", "記憶",
+    "%", "_", "a%b", "a_c", "%願%", "_主", "İ", "i", "é", "É", "\"", "[", "]", ",", "odd",
+    "zz", "不存在",
+]
+
+def rand_text(rnd: random.Random, lo: int, hi: int) -> str:
+    return "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(lo, hi)))
+
+def rand_tags(rnd: random.Random, n: int):
+    if n % 17 == 0:
+        return {"odd": "k"}          # 非清單 tags（bundle 匯入可能出現）
+    if n % 23 == 0:
+        return ["k", 1]              # 清單但含非字串
+    if n % 29 == 0:
+        return "k"
+    return [rand_text(rnd, 1, 3) for _ in range(rnd.randint(0, 3))]
+
+def load_rows(con, store, rnd: random.Random, count: int):
+    for n in range(count):
+        mid = str(uuid.uuid4())
+        content = rand_text(rnd, 1, 12)
+        tags = rand_tags(rnd, n)
+        ts = float(rnd.randint(0, 40))  # 範圍小，刻意製造 ts 相同
+        con.execute("INSERT INTO memory (id, content, tags, ts) VALUES (?,?,?,?)",
+                    (mid, content, json.dumps(tags, ensure_ascii=False), ts))
+        store.put(mid, content, tags, ts)
+
+def set_content(con, store, mid: str, content: str):
+    con.execute("UPDATE memory SET content=? WHERE id=?", (content, mid))
+    store.set_content(mid, content)
+
+def assert_parity(con, store, rnd: random.Random):
+    for q in QUERIES + [rand_text(rnd, 1, 3) for _ in range(100)]:
+        for k in (1, 5, 100):
+            assert store.search(q, k) == sql_search(con, q, k), (q, k)
+    assert store.recent() == sql_recent(con)
+    assert store.recent(7) == sql_recent(con, 7)
+    assert store.stats() == sql_stats(con)
+
+def crash_image(path: str, dst: str) -> str:
+    # 模擬當機：只複製磁碟上的檔案（快照／日誌），不經過 close() 的收尾快照
+    for suffix in (".snap", ".log", ".old.log"):
+        if os.path.exists(path + suffix):
+            shutil.copy(path + suffix, dst + suffix)
+    return dst
+
+@pytest.fixture
+def rnd():
+    return random.Random(20261019)
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "mem")
+
+@pytest.fixture
+def open_store(path):
+    # 開啟的 store 於測試結束時一律 close（收掉日誌檔與背景快照執行緒）
+    stores = []
+
+    def _open(p: str = path, **kw) -> MemStore:
+        kw.setdefault("fsync", False)
+        store = MemStore(p, **kw)
+        stores.append(store)
+        return store
+
+    yield _open
+    for store in stores:
+        store.close()
+
+def test_search_parity(rnd, open_store):
+    con, store = sql_conn(), open_store()
+    load_rows(con, store, rnd, 400)
+    assert_parity(con, store, rnd)
+
+def test_ascii_only_case_folding(open_store):
+    con, store = sql_conn(), open_store()
+    for n, content in enumerate(["ABC", "abc", "İstanbul", "istanbul", "École", "école"]):
+        con.execute("INSERT INTO memory VALUES (?,?,?,?)", (f"id{n}", content, "[]", float(n)))
+        store.put(f"id{n}", content, [], float(n))
+    for q in ("abc", "ABC", "aBc", "İ", "i", "É", "é"):
+        assert [m["id"] for m in store.search(q, 10)] == [m["id"] for m in sql_search(con, q, 10)], q
+
+def test_tags_matched_via_json_text(open_store):
+    con, store = sql_conn(), open_store()
+    rows = [("a", "x", ["k"]), ("b", "y", ["kk"]), ("c", "z", {"k": 1}), ("d", "w", [])]
+    for mid, content, tags in rows:
+        con.execute("INSERT INTO memory VALUES (?,?,?,?)", (mid, content, json.dumps(tags, ensure_ascii=False), 1.0))
+        store.put(mid, content, tags, 1.0)
+    for q in ('"k"', "k", "[]", '{"k"', "[%]"):
+        assert store.search(q, 10) == sql_search(con, q, 10), q
+
+def test_reopen_from_snapshot_and_log(rnd, path, open_store):
+    con, store = sql_conn(), open_store(snapshot_every=50)
+    load_rows(con, store, rnd, 230)  # 涵蓋多次背景快照，尾端留在日誌
+    for round_ in range(2):
+        # 第二輪在快照索引（mmap）之上寫入與改內容，再合併成新快照
+        ids = [m["id"] for m in sql_recent(con)]
+        for mid in rnd.sample(ids, 20):
+            set_content(con, store, mid, rand_text(rnd, 1, 12))
+        store.close()
+        store = open_store(snapshot_every=50)
+        assert_parity(con, store, rnd)
+        load_rows(con, store, rnd, 70)
+        assert_parity(con, store, rnd)
+
+def test_crash_replays_log(rnd, path, open_store):
+    con, store = sql_conn(), open_store(snapshot_every=10 ** 6)
+    load_rows(con, store, rnd, 60)
+    store.close()  # 快照涵蓋前 60 筆
+    store = open_store(snapshot_every=10 ** 6)
+    load_rows(con, store, rnd, 60)
+    for mid in [m["id"] for m in sql_recent(con, 10)]:
+        set_content(con, store, mid, "清單測試 " + mid)
+    # 當機：由快照＋日誌重建
+    assert_parity(con, open_store(crash_image(path, path + "-crash")), rnd)
+
+def test_reset_survives_crash(rnd, path, open_store):
+    con, store = sql_conn(), open_store(snapshot_every=10 ** 6)
+    load_rows(con, store, rnd, 60)
+    store.close()  # 先落快照，確認 reset 不會被舊快照＋日誌還原
+    store = open_store(snapshot_every=10 ** 6)
+    store.reset()
+    con.execute("DELETE FROM memory")
+    load_rows(con, store, rnd, 15)
+    assert_parity(con, open_store(crash_image(path, path + "-crash")), rnd)
+    store.close()
+    assert_parity(con, open_store(), rnd)
+
+def test_bulk_put_matches_put(rnd, path, open_store):
+    con, store = sql_conn(), open_store()
+    load_rows(con, store, rnd, 200)
+    bulk = open_store(path + "-bulk")
+    bulk.bulk_put(sql_recent(con))
+    assert_parity(con, bulk, rnd)
+    assert_parity(con, open_store(path + "-bulk"), rnd)
+
+def test_bulk_put_waits_for_background_snapshot(rnd, path, open_store):
+    con, store = sql_conn(), open_store(snapshot_every=1)
+    load_rows(con, store, rnd, 40)  # 每筆寫入都觸發背景快照
+    extra_con, scratch = sql_conn(), open_store(path + "-scratch")
+    load_rows(extra_con, scratch, rnd, 30)
+    rows = sql_recent(extra_con)
+    store.bulk_put(rows)
+    for m in rows:
+        con.execute("INSERT INTO memory VALUES (?,?,?,?)",
+                    (m["id"], m["content"], json.dumps(m["tags"], ensure_ascii=False), m["ts"]))
+    assert_parity(con, store, rnd)
+    store.close()
+    assert_parity(con, open_store(), rnd)
+
+def test_seeded_flag_persists(rnd, open_store):
+    store = open_store()
+    assert not store.seeded
+    store.bulk_put([])
+    assert store.seeded
+    store.reset()
+    store.close()
+    store = open_store()
+    assert store.seeded and store.stats() == (0, None)
+
+def test_search_not_blocked_by_log_fsync(monkeypatch, open_store):
+    store = open_store(fsync=True)
+    store.put("a", "清單", [], 1.0)
+    in_fsync, release = threading.Event(), threading.Event()
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        in_fsync.set()
+        release.wait(5)
+        real_fsync(fd)
+
+    monkeypatch.setattr(memstore.os, "fsync", slow_fsync)
+    writer = threading.Thread(target=store.put, args=("b", "清單測試", [], 2.0))
+    writer.start()
+    try:
+        assert in_fsync.wait(5)
+        result = []
+        reader = threading.Thread(target=lambda: result.extend(store.search("清單", 5)))
+        reader.start()
+        reader.join(2)
+        assert not reader.is_alive()
+        assert [m["id"] for m in result] == ["a"]  # 寫入尚未落地，不可見
+    finally:
+        release.set()
+        writer.join()
+    assert [m["id"] for m in store.search("清單", 5)] == ["b", "a"]